@@ -49,6 +49,37 @@ def orderless_similarity(x, y, simi_fn):
     return current_max
 
 
+def sequence_matcher_similarity(threshold):
+    """
+    Returns a difflib-based similarity function f(x, y) that builds a single
+    SequenceMatcher per query y, so that its index is computed once and then
+    reused across all the x compared against it. Junk heuristics are disabled
+    as they may silently lower the ratio of long strings.
+
+    threshold : float
+        Pairs whose cheap upper bounds on the ratio do not exceed this value
+        are not fully matched, and the bound is returned instead.
+
+    """
+    matchers = {}
+
+    def similarity(x, y):
+        matcher = matchers.get(y)
+        if matcher is None:
+            matcher = matchers[y] = SequenceMatcher(None, b=y, autojunk=False)
+        matcher.set_seq1(x)
+
+        upper_bound = matcher.real_quick_ratio()
+        if upper_bound <= threshold:
+            return upper_bound
+        upper_bound = matcher.quick_ratio()
+        if upper_bound <= threshold:
+            return upper_bound
+        return matcher.ratio()
+
+    return similarity
+
+
 def filter_metadata(metadata, attribute, query, simi_fn=None, 
     threshold=.8, orderless=False):
     """
@@ -77,7 +108,7 @@ def filter_metadata(metadata, attribute, query, simi_fn=None,
     if isinstance(metadata, str):  # load dataframe
         metadata = pd.read_csv(metadata)
     
-    fn = (lambda x,y: SequenceMatcher(None, x, y).ratio()) \
+    fn = sequence_matcher_similarity(threshold) \
         if simi_fn is None else lambda x,y: simi_fn.normalized_similarity(x, y)
     if orderless:  # wrap the similarity function for orderless behaviour 
         fn = partial(orderless_similarity, simi_fn=fn)
@@ -1,90 +1,199 @@
 #!/usr/bin/env python3
 
 import hashlib
-import json
+import math
 import os
+import re
 import sys
-from difflib import SequenceMatcher
-from json import JSONDecodeError
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 
-from rdflib import Graph, URIRef
+import numpy as np
+import orjson
+from joblib import Parallel, delayed
+from rapidfuzz import process
+from rapidfuzz.distance import Indel
 
 similarity_ratio = 0.80
 midildc_prefix = "https://purl.org/midi-ld/piece/"
 choco_prefix = "https://purl.org/choco/data/"
 musicbrainz_prefix = "https://musicbrainz.org/recording/"
 owl_prefix = "http://www.w3.org/2002/07/owl#"
-
-
-def midi_choco_links(midi_path, jams_path, links_outfile):
-    links = Graph()
-
+write_buffer_size = 1 << 20
+
+# Byte templates of the owl:sameAs N-Triples lines written by midi_choco_links
+midildc_uri_start = b"<" + midildc_prefix.encode()
+choco_uri_start = b"<" + choco_prefix.encode()
+musicbrainz_uri_start = b"<" + musicbrainz_prefix.encode()
+uri_end = b">"
+same_as_predicate = b" <" + owl_prefix.encode() + b"sameAs> "
+triple_end = b" .\n"
+
+whitespace_pattern = re.compile(r'\s+')
+
+
+def _hash_file(file_path, chunk_size=1 << 20):
+    """
+    Computes the MD5 fingerprint of a file, reading it in fixed-size chunks.
+    MD5 is kept as it is the identifier used by MIDI-LD piece URIs.
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _iter_files(root_path, suffixes):
+    """
+    Recursively yields the paths of the files under `root_path` whose name
+    ends with one of the given `suffixes`, without following symlinks.
+    """
+    stack = [root_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(suffixes):
+                    yield entry.path
+
+
+def _normalise_name(name):
+    """
+    Lowercases a name, collapsing runs of whitespace into single spaces and
+    stripping the ends, so that case and spacing do not lower the similarity.
+    """
+    return whitespace_pattern.sub(' ', name.lower()).strip()
+
+
+def _length_band(length, ratio):
+    """
+    Returns the (inclusive) range of string lengths that can still reach the
+    given Indel similarity `ratio` when compared to a string of `length`:
+    since 2 * LCS / (la + lb) <= 2 * min / (la + lb), the shorter string must
+    be at least ratio / (2 - ratio) times the longer one.
+    """
+    eps = 1e-9  # guards the bounds against float rounding
+    return (math.ceil(length * ratio / (2 - ratio) - eps),
+            math.floor(length * (2 - ratio) / ratio + eps))
+
+
+def _similar_pairs(midi_names, jams_names, n_workers=-1):
+    """
+    Yields the (midi index, jams index) pairs whose names are more similar
+    than `similarity_ratio`. Names are grouped by length so that each group is
+    only scored against the JAMS names falling in its length band, and the
+    rows of each group are scored by `n_workers` native threads.
+    """
+    jams_order = sorted(range(len(jams_names)), key=lambda i: len(jams_names[i]))
+    jams_lengths = [len(jams_names[i]) for i in jams_order]
+
+    midis_by_length = defaultdict(list)
+    for midi_i, midi_name in enumerate(midi_names):
+        midis_by_length[len(midi_name)].append(midi_i)
+
+    for length, midi_group in midis_by_length.items():
+        min_length, max_length = _length_band(length, similarity_ratio)
+        band = jams_order[bisect_left(jams_lengths, min_length):
+                          bisect_right(jams_lengths, max_length)]
+        if not band:
+            continue
+        # Distances above the largest one that can pass in the band are only
+        # bounded by rapidfuzz; pairs are then linked if their similarity,
+        # 2 * LCS / (la + lb) = (la + lb - distance) / (la + lb), is strictly
+        # above `similarity_ratio`, as for the ratio of SequenceMatcher
+        totals = length + np.array([len(jams_names[j]) for j in band])
+        max_distance = int(totals.max() * (1 - similarity_ratio)) + 1
+        distances = process.cdist([midi_names[i] for i in midi_group],
+                                  [jams_names[j] for j in band],
+                                  scorer=Indel.distance,
+                                  score_cutoff=max_distance,
+                                  dtype=np.int32, workers=n_workers)
+        # Two empty names are identical, as for SequenceMatcher (ratio of 1)
+        ratios = np.divide(totals - distances, totals,
+                           out=np.ones(distances.shape), where=totals > 0)
+        similar = ratios > similarity_ratio
+        for row, col in zip(*np.nonzero(similar)):
+            yield midi_group[row], band[col]
+
+
+def midi_choco_links(midi_path, jams_path, links_outfile, n_workers=-1):
     abs_midi_path = os.path.abspath(midi_path)
     abs_jams_path = os.path.abspath(jams_path)
     print("Walking {}".format(abs_midi_path))
 
-    midis = []
-    for root, dirs, files in os.walk(abs_midi_path):
-        for file in files:
-            if ".mid" in file or ".midi" in file:
-                midi_file_path = os.path.join(root, file)
-                midi_file_name = os.path.splitext(file)[0]
-                md5_midi_id = hashlib.md5(open(midi_file_path, 'rb').read()).hexdigest()
-                midis.append({'id': md5_midi_id, 'name': midi_file_name})
+    midi_paths = list(_iter_files(abs_midi_path, ('.mid', '.midi')))
+
+    # Fingerprinting is independent per file, hence it is spread over workers
+    midi_ids = Parallel(n_jobs=n_workers)(
+        delayed(_hash_file)(midi_file_path) for midi_file_path in midi_paths)
+    midis = [{'id': md5_midi_id,
+              'name': os.path.splitext(os.path.basename(midi_file_path))[0],
+              'uri': midildc_uri_start + md5_midi_id.encode() + uri_end}
+             for midi_file_path, md5_midi_id in zip(midi_paths, midi_ids)]
 
     print("Walking {}".format(abs_jams_path))
 
-    jams = []
-    for root, dirs, files in os.walk(abs_jams_path):
-        for file in files:
-            choco_path = os.path.join(root, file).split('/')[7]
-            # print("Choco path: {}, jams collection: {}".format(choco_path, jams_collection))
-            if ".jams" in file and "choco" in choco_path:
-                # print(root, file)
-                with open(os.path.join(root, file), 'r') as jams_file:
-                    try:
-                        jams_data = json.load(jams_file)
-                        jams_collection = str(os.path.join(root, file)).split('/')[6]
-                        # jams_item = str(os.path.join(root,file)).split('/')[-1].split('.')[0]
-                        # jams_id = jams_collection + '/' + jams_item
-                        jams_id = jams_collection + '/' + file.split('.')[0]
-                        jams_name = str(jams_data['file_metadata']['artist']) + " " + str(
-                            jams_data['file_metadata']['title'])
-                        jams.append({'id': jams_id, 'name': jams_name})
-
-                        # If we have links to MusicBrainz, we add them
-                        if 'MB' in jams_data['file_metadata']['identifiers']:
-                            s = URIRef(choco_prefix + jams_id.replace(" ", "_"))
-                            p = URIRef(owl_prefix + 'sameAs')
-                            o = URIRef(musicbrainz_prefix + jams_data['file_metadata']['identifiers']['MB'])
-                            links.add((s, p, o))
-
-                    except JSONDecodeError as e:
-                        print("Error reading JAMS file {}: {}".format(os.path.join(root, file), e))
-                        pass
-
-    print("Writing inherited links from JAMS.file_metadata.identifiers...")
-    with open(links_outfile, 'w') as linksfile:
-        linksfile.write(links.serialize(format='nt'))
-
-    links = Graph()
-
-    print("Comparing JAMS with MIDI metadata...")
-
-    for midi_i, m in enumerate(midis):
-        print("Doing MIDI {} of {}".format(midi_i, len(midis)))
+    # Expected layout: <jams path>/<collection>/choco/.../<item>.jams, with
+    # paths being relative to the JAMS root as yielded by the walk
+    jams_paths = []
+    root_length = len(os.path.join(abs_jams_path, ''))
+    for jams_file_path in _iter_files(abs_jams_path, '.jams'):
+        rel_parts = jams_file_path[root_length:].split(os.sep)
+        if len(rel_parts) > 2 and "choco" in rel_parts[1]:
+            jams_id = rel_parts[0] + '/' + rel_parts[-1].split('.')[0]
+            jams_paths.append((jams_file_path, jams_id))
+
+    # Links are written as plain N-Triples lines, one per match, and flushed
+    # to disk in blocks of `write_buffer_size` bytes
+    with open(links_outfile, 'wb', buffering=write_buffer_size) as linksfile:
+        jams = []
+        for jams_file_path, jams_id in jams_paths:
+            with open(jams_file_path, 'rb') as jams_file:
+                try:
+                    # Only the metadata fields are kept, the annotations
+                    # are released before the next file is parsed
+                    file_metadata = orjson.loads(jams_file.read())['file_metadata']
+                    artist = file_metadata['artist']
+                    title = file_metadata['title']
+                    mb = file_metadata['identifiers'].get('MB')
+                    del file_metadata
+
+                    jams_name = str(artist) + " " + str(title)
+                    jams_uri = choco_uri_start + jams_id.replace(' ', '_').encode() + uri_end
+                    jams.append({'id': jams_id, 'name': jams_name, 'uri': jams_uri})
+
+                    # If we have links to MusicBrainz, we add them
+                    if mb is not None:
+                        linksfile.write(b"".join((
+                            jams_uri, same_as_predicate,
+                            musicbrainz_uri_start, mb.encode(), uri_end,
+                            triple_end)))
+
+                except orjson.JSONDecodeError as e:
+                    print("Error reading JAMS file {}: {}".format(jams_file_path, e))
+                    pass
+
+        print("Comparing JAMS with MIDI metadata...")
+
+        # Names are normalised once per entry, and entries sharing the same
+        # normalised name are scored once and then linked altogether
+        midi_uris = defaultdict(list)
+        for m in midis:
+            midi_uris[_normalise_name(m['name'])].append(m['uri'])
+        jams_uris = defaultdict(list)
         for j in jams:
-            if SequenceMatcher(None, m['name'], j['name']).ratio() > similarity_ratio:
-                # print("{} || {}".format(m['name'], j['name']))
-                s = URIRef(midildc_prefix + m['id'])
-                p = URIRef(owl_prefix + 'sameAs')
-                o = URIRef(choco_prefix + j['id'].replace(" ", "_"))
-                links.add((s, p, o))
-                with open(links_outfile, 'a') as linksfile:
-                    linksfile.write(links.serialize(format='nt'))
-                links = Graph()
-                # time.sleep(1)
-
+            jams_uris[_normalise_name(j['name'])].append(j['uri'])
+
+        midi_names = list(midi_uris)
+        jams_names = list(jams_uris)
+        for midi_i, jams_i in _similar_pairs(midi_names, jams_names, n_workers):
+            # print("{} || {}".format(midi_names[midi_i], jams_names[jams_i]))
+            for midi_uri in midi_uris[midi_names[midi_i]]:
+                for jams_uri in jams_uris[jams_names[jams_i]]:
+                    linksfile.write(b"".join((
+                        midi_uri, same_as_predicate, jams_uri, triple_end)))
 
 if __name__ == "__main__":
     if len(sys.argv) < 4:
@@ -9,7 +9,7 @@ import sqlite3
 import hashlib
 import logging
 
-from contextlib import closing
+from contextlib import closing, contextmanager
 
 logger = logging.getLogger("choco.db")
 
@@ -92,6 +92,42 @@ class iRealDatabaseHandler(object):
         return results
 
 
+    @contextmanager
+    def transaction(self):
+        """
+        Bundle the registrations made within the context, which are committed
+        together on exit, rather than being left pending until the database is
+        closed; if an error is raised within the context, they are rolled back.
+
+        """
+        try:
+            yield self
+        except BaseException:
+            self._connection.rollback()
+            raise
+        else:
+            self._connection.commit()
+
+
+    def search_chart(self, chart:str):
+        """
+        Look up a chart in the database, without registering it.
+
+        Parameters
+        ----------
+        chart : str
+            A string encoding an iReal chart, after decoding the URL.
+
+        Returns
+        -------
+        The integer ID of the chart, if already registered, otherwise None.
+
+        """
+        chartex = (hashlib.sha1(chart.encode("utf-8")).hexdigest(),)
+        matches = self.execute_transaction(ireal_chart_search, chartex)
+        return matches[0][0] if len(matches) > 0 else None
+
+
     def register_chart(self, chart:str):
         """
         Check whether a chart is already present in the database and, if not,
@@ -113,17 +149,17 @@ class iRealDatabaseHandler(object):
         this seems to be tricky when using SQLite.
 
         """
-        cursor = self._connection.cursor()  # get a fresh cursor
         chartex = (hashlib.sha1(chart.encode("utf-8")).hexdigest(),)
         # Check if the chart has already been registered in the database
         # The following 2 execution should be bundled in the same transaction.
-        matches = cursor.execute(ireal_chart_search, chartex).fetchall()
-        if len(matches) > 0: return None
-        cursor.execute(ireal_chart_insert, chartex).fetchall()
-        # matches = self.execute_transaction(ireal_chart_search, chartex)
-        # assert len(matches) == 1, "Non-unique or unregistered iReal hash"
+        with closing(self._connection.cursor()) as cursor:
+            matches = cursor.execute(ireal_chart_search, chartex).fetchall()
+            if len(matches) > 0: return None
+            cursor.execute(ireal_chart_insert, chartex).fetchall()
+            # matches = self.execute_transaction(ireal_chart_search, chartex)
+            # assert len(matches) == 1, "Non-unique or unregistered iReal hash"
 
-        return cursor.lastrowid  # succesful insertion in the DB
+            return cursor.lastrowid  # succesful insertion in the DB
     
 
     def register_metadata(self, chart_id:int, chart_meta:dict):
@@ -5,18 +5,18 @@ The implementation currently leverages `pyRealParser`.
 """
 import os
 import re
-import glob
-import copy
 import urllib
 import logging
-import itertools
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 
 import jams
 import numpy as np
 import pandas as pd
 from pyRealParser import Tune
 from tqdm import tqdm
-from joblib import Parallel, delayed, parallel_backend
+from joblib import Parallel, delayed, effective_n_jobs
+from joblib.externals.loky import ProcessPoolExecutor as LokyProcessPoolExecutor
 
 
 from jams_utils import register_jams_meta, register_annotation_meta
@@ -26,11 +26,48 @@ from utils import create_dir, pad_substring
 
 logger = logging.getLogger("choco.ireal_parser")
 
+IREAL_META_COLUMNS = ["id", "title", "artists", "genre", "tempo",
+                      "time_signature", "jams_path"]  # as in extracted meta
+
 IREAL_RE = r'irealb://([^"]+)'
 IREAL_NREP_RE = r"{.+?N\d.+?}"  # to identify all complex repeats
 IREAL_REPEND_RE = r"([{\[|]?)\s*N(\d)"  # to identify all ending markers
 IREAL_CHORD_RE = r'(?<!/)([A-Gn][^A-G/]*(?:/[A-G][#b]?)?)'  # an iReal chord
 
+# Compiled patterns, shared by all the tunes parsed by the same process
+_RE_IREAL = re.compile(IREAL_RE)
+_RE_NREP = re.compile(IREAL_NREP_RE)
+_RE_REPEND = re.compile(IREAL_REPEND_RE)
+_RE_CHORD = re.compile(IREAL_CHORD_RE)
+_RE_LONG_REPEAT = re.compile(r'{(.+?)}')
+_RE_ND = re.compile(r'N\d')
+_RE_FIRST_ND = re.compile(r'N(\d)')
+_RE_FIRST_ENDING = re.compile(r'([^N]+)N\d')
+_RE_XREPEAT = re.compile(r'<(\d+)x>')
+_RE_SINGLE_DOUBLE_REPEAT = re.compile(r'[rx]')
+_RE_LEADING_SLASHES = re.compile(r'^(p+)')
+_RE_MULTI_SPACE = re.compile(r'\s\s+')
+_RE_MARKERS = re.compile(r'U|S|Q|N\d')
+_RE_MEASURE_SPLIT = re.compile(r'\||LZ|K|Z|{|}|\[|\]')
+# Single-character deletions are cheaper as translations than as patterns
+_DELETE_CODA_SEGNO = str.maketrans('', '', 'QS')
+_DELETE_PART_SEGNO = str.maketrans('', '', 'US')
+# Chord string cleanup, see ChoCoTune._cleanup_chord_string: the replacement
+# of each alternative is indexed by the group it captures, and empty spaces
+# (XyQ) may be interleaved by the spacers that are removed along the way
+_RE_CLEANUP = re.compile(
+    r'(LZ|K)|(cl)|(\*\s*\*|Y+)|(X(?:Y|\*\s*\*)*y(?:Y|\*\s*\*)*Q|,)')
+_CLEANUP_REPLACEMENTS = (None, '|', 'x', '', ' ')
+_RE_EMPTY_MEASURE = re.compile(r'\|\s*\|')
+_RE_PADDED_OVAL = re.compile(r'W(?:/[A-G][#b]?)?')
+_RE_WHITESPACE = re.compile(r'(\|)?\s+')
+# Unsupported annotations, see ChoCoTune._remove_unsupported_annotations:
+# square brackets are matched as bar lines, and removed annotations are
+# distinguished from the alternative chords that leave a space behind
+_RE_BRACKET_MEASURE = re.compile(r'[\[\]|]\s*[\[\]|]|[\[\]]')
+_RE_UNSUPPORTED = re.compile(
+    r'((?!<\d+x>)<.*?>|[lf]|(?<!su)s(?!us)|\*\w|T\d+)|(\([^)]*\))')
+
 
 def split_ireal_charts(ireal_url:str):
     """
@@ -49,28 +86,40 @@ def split_ireal_charts(ireal_url:str):
 
     """
     ireal_string = urllib.parse.unquote(ireal_url)
-    match = re.match(IREAL_RE, ireal_string)
+    match = _RE_IREAL.match(ireal_string)
     if match is None:
         raise RuntimeError('Provided string is not a valid iReal url!')
     # Split the url into individual charts along the '===' separator
-    charts = re.split("===", match.group(1))
+    charts = match.group(1).split('===')
     charts = [c for c in charts if c != '']
 
     return charts
 
 
+def _edge_symbol(chord_string:str, last=False):
+    """
+    Return the first (or last) non-whitespace symbol of a non-blank chord
+    string, without stripping (and thus copying) the whole string.
+    """
+    positions = range(len(chord_string)-1, -1, -1) if last \
+        else range(len(chord_string))
+    return next(chord_string[i] for i in positions
+                if not chord_string[i].isspace())
+
+
 def mjoin(chord_string:str, *others):
     """
     Metrical join between chord strings, inserting a measure symbol "|" among 
     consecutive chord strings only if a (bar) separator is missing. Everything
     will look like this: "string_a | string_b | ... | string_z".
     """
-    pre_chords = [cs for cs in [chord_string]+list(others) if cs.strip() != ""]
+    pre_chords = [cs for cs in (chord_string,)+others
+                  if cs != "" and not cs.isspace()]
     merged_chords = [pre_chords[0]]  # take first non-empty string
     for next_cstring in pre_chords[1:]:
         # print(next_cstring + "\n\n")
-        separator = "|" if merged_chords[-1].rstrip()[-1] != "|" \
-            and next_cstring.lstrip()[0] != "|" else ""
+        separator = "|" if _edge_symbol(merged_chords[-1], last=True) != "|" \
+            and _edge_symbol(next_cstring) != "|" else ""
         merged_chords.append(separator+next_cstring)
 
     merged_chords = "".join(merged_chords)
@@ -79,6 +128,15 @@ def mjoin(chord_string:str, *others):
 
 class ChoCoTune(Tune):
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _remove_markers(chord_string):
+        """
+        Remove part markers, segnos, codas and ending numbers from the chord
+        string. Results are cached, as the same measures are often repeated.
+        """
+        return _RE_MARKERS.sub('', chord_string)
+
     @classmethod
     def _insert_missing_repeat_brackets(cls, chord_string):
         """
@@ -120,16 +178,33 @@ class ChoCoTune(Tune):
             special comment may be used to indicate the number of repeats.
 
         """
-        repeat_match = re.search(r'{(.+?)}', chord_string)
-        if repeat_match is None:
-            return chord_string
+        # The prefix before a repeat never contains another one, so each
+        # search resumes from the first position rewritten by the expansion.
+        repeat_match = _RE_LONG_REPEAT.search(chord_string)
+        while repeat_match is not None:
+            chord_string, pos = \
+                cls._expand_long_repeat(chord_string, repeat_match)
+            repeat_match = _RE_LONG_REPEAT.search(chord_string, pos)
+
+        return chord_string
+
+    @classmethod
+    def _expand_long_repeat(cls, chord_string, repeat_match):
+        """
+        Expands the long repeat matched in the chord string, either a complex
+        repetition with different endings or a full bracketed repetition, and
+        returns the new chord string with the first position that has changed.
+        """
         full_repeat = repeat_match.group(1)
+        # Blank prefixes are dropped by mjoin, so the splice is at the head
+        first_change = repeat_match.start() \
+            if chord_string[:repeat_match.start()].strip() != "" else 0
 
         # Check whether there is a first ending in the repeat
-        number_match = re.search(r'N(\d)', full_repeat)
+        number_match = _RE_FIRST_ND.search(full_repeat)
         if number_match is not None:
             # Sanity check and verification of additional numbered repeats
-            macro_repeats = list(re.finditer(IREAL_NREP_RE, chord_string))
+            macro_repeats = list(_RE_NREP.finditer(chord_string))
             logger.info(f"Found {len(macro_repeats)} complex repeat(s)")
             current_mrstart = macro_repeats[0].start()  # of this macro repeat
             current_bnd = macro_repeats[1].start() \
@@ -138,25 +213,39 @@ class ChoCoTune(Tune):
                 f"Illegal substitution: current macro repeat starts at " \
                 f"{current_mrstart}, next macro (or end) at {current_bnd}"
             # Now, get rid of the first repeat number and the curly braces
-            first_repeat = re.sub(r'N\d', '', full_repeat)
+            first_repeat = _RE_ND.sub('', full_repeat)
             logger.info(f"Resolving first marked repeat in {full_repeat}")
             new_chord_string = mjoin(
                 chord_string[:repeat_match.start()], \
                 first_repeat, chord_string[repeat_match.end():])
             # Remove the first repeat ending as well as segnos and codas
             repeat = cls._remove_markers(
-                re.search(r'([^N]+)N\d', full_repeat).group(1))
+                _RE_FIRST_ENDING.search(full_repeat).group(1))
             # Find the next ending markers and insert the repeated chords before
-            for _ in re.findall(IREAL_REPEND_RE, new_chord_string):
-                mrep = lambda x: x.group(1) + repeat \
-                        if x.start() < current_bnd else x.group(0)
-                new_chord_string = re.sub(
-                    IREAL_REPEND_RE, mrep, new_chord_string)
+            # them, in a single pass equivalent to repeated passes that fill the
+            # markers found before the boundary in the string left by the last
+            # pass, as markers shifted before it by shrinking fills are filled
+            pass_shift = 0  # length change of the string seen by the pass
+            shift = 0  # length change of the string filled so far
+            def mrep(x):
+                nonlocal pass_shift, shift
+                if x.start() + pass_shift >= current_bnd:
+                    if x.start() + shift >= current_bnd:
+                        return x.group(0)  # beyond the boundary in any pass
+                    pass_shift = shift  # filled by the next pass
+                filled = x.group(1) + repeat
+                shift += len(filled) - len(x.group(0))
+                return filled
+            new_chord_string = _RE_REPEND.sub(mrep, new_chord_string)
+            # Ending markers preceding the repeat are also filled
+            first_end = _RE_REPEND.search(chord_string, 0, first_change)
+            if first_end is not None:
+                first_change = first_end.start()
 
         else:  # Bracket repeat: which can either be performed twice or more
             to_repeat, times = full_repeat, 2  # defaul case (brackets only)
             # Check whether the number of repeats is explicitly annotated
-            no_repeats_match = list(re.finditer(r'<(\d+)x>', full_repeat))
+            no_repeats_match = list(_RE_XREPEAT.finditer(full_repeat))
             if len(no_repeats_match) > 0:  # explicit repeats provided
                 times = int(no_repeats_match[-1].group(1))  # use last marker
                 s, e = no_repeats_match[-1].start(), no_repeats_match[-1].end()
@@ -170,9 +259,7 @@ class ChoCoTune(Tune):
                 to_repeat, repetitions, \
                 chord_string[repeat_match.end():])  # + '|'
 
-        # There could be other repeat somewhere, so we need to go recursive
-        new_chord_string = cls._fill_long_repeats(new_chord_string)
-        return new_chord_string
+        return new_chord_string, first_change
     
     @classmethod
     def _fill_codas(cls, chord_string):
@@ -202,14 +289,15 @@ class ChoCoTune(Tune):
             chord_string = chord_string.replace('Q', '')
 
         elif qs == 2:  # repeat from the head/S to first Q then jump to second Q
-            q1, q2 = [i for i, c in enumerate(chord_string) if c == 'Q']
+            q1 = chord_string.index('Q')
+            q2 = chord_string.index('Q', q1 + 1)
             segno = chord_string.find('S')  # get the first segno
             segno = 0 if segno == -1 else segno + 1  # segno as offset
             # Ready to extract coda and repeat, then infill
             coda = chord_string[q2 + 1:]
             repeat = chord_string[segno:q1]
             new_chord_string = chord_string[:q2] + repeat + ' |' + coda
-            new_chord_string = re.sub(r'[QS]', '', new_chord_string)
+            new_chord_string = new_chord_string.translate(_DELETE_CODA_SEGNO)
             return new_chord_string
 
         return chord_string
@@ -233,8 +321,8 @@ class ChoCoTune(Tune):
         """
         pre_measures = []
         for measure in measures:  # marker has its own parenthesis
-            splits = re.split(r"[rx]", measure)
-            markers = re.findall(r"[rx]", measure)
+            splits = _RE_SINGLE_DOUBLE_REPEAT.split(measure)
+            markers = _RE_SINGLE_DOUBLE_REPEAT.findall(measure)
             measures_xt = [val.strip() \
                 for pair in zip(splits, markers+[""]) \
                 for val in pair if val.strip() != ""]
@@ -279,19 +367,25 @@ class ChoCoTune(Tune):
             A new list of measures with filled slashes.
 
         """
-        chord_regex = re.compile(IREAL_CHORD_RE)
-
         for i in range(len(measures)):
-            while measures[i].find('p') != -1:
-                slash = measures[i].find('p')
+            measure = measures[i]
+            # Chords preceding the last one found before a slash are not
+            # affected by its infill, so both searches resume where they were
+            slash, last_chord = measure.find('p'), 0
+            while slash != -1:
                 if slash == 0:  # slash in 1st position needs measure lookback
-                    prev_chord = chord_regex.findall(measures[i - 1])[-1] + " "
-                    measures[i] = prev_chord + measures[i][1:]
-                    measures[i] = re.sub(r'^(p+)', prev_chord, measures[i])  # ?
+                    prev_chord = _RE_CHORD.findall(measures[i - 1])[-1] + " "
+                    measure = prev_chord + measure[1:]
+                    measure = _RE_LEADING_SLASHES.sub(prev_chord, measure)  # ?
                 else:  # repeating a chord that should be found in the same bar
-                    prev_chord = chord_regex.findall(measures[i][:slash])[-1]
-                    measures[i] = measures[i][:slash] + \
-                        prev_chord + " " + measures[i][slash + 1:]
+                    chord_match = list(
+                        _RE_CHORD.finditer(measure, last_chord, slash))[-1]
+                    prev_chord, last_chord = \
+                        chord_match.group(1), chord_match.start()
+                    measure = measure[:slash] + \
+                        prev_chord + " " + measure[slash + 1:]
+                slash = measure.find('p', slash)
+            measures[i] = measure
 
         return measures
 
@@ -324,30 +418,34 @@ class ChoCoTune(Tune):
 
         """
         # No-chord symbols are padded and capitalised
-        new_measures = copy.deepcopy(measures)
+        new_measures = list(measures)
         for i in range(len(new_measures)):
             while new_measures[i].find('n') != -1:  # safe with replace
                 new_measures[i] = pad_substring(new_measures[i], "n", "N")
 
         for i in range(len(new_measures)):  # filling ovals with previous root
-            for observation in new_measures[i].split():
-                chord_match = re.match(IREAL_CHORD_RE, observation)
+            measure, oval = new_measures[i], 0
+            for observation in measure.split():
+                chord_match = _RE_CHORD.match(observation)
                 if chord_match:  # record last chord to be ready to infill root
                     last_root = chord_match.group(1).split("/")[0]
                 else:  # this can be any other element, or possibly a W/?
-                    if "W" in observation:  # fire a single replace (count 1)
-                        new_measures[i] = re.sub(
-                            r"W", last_root, new_measures[i], count=1)
+                    if "W" in observation:  # replace the first oval left
+                        oval = measure.find("W", oval)  # none before the last
+                        if oval != -1:
+                            measure = measure[:oval] + last_root + \
+                                measure[oval + 1:]
+            new_measures[i] = measure
 
         for i in range(len(new_measures)):  # final pass to remove extras
             measure_tmp = new_measures[i]
-            measure_tmp = re.sub(r"[US]", "", measure_tmp)
-            measure_tmp = re.sub(r"\s\s+", " ", measure_tmp).strip()
+            measure_tmp = measure_tmp.translate(_DELETE_PART_SEGNO)
+            measure_tmp = _RE_MULTI_SPACE.sub(" ", measure_tmp).strip()
             # Now some rare cases of non-handled repeats due to bad formatting
-            if re.search("N\d", measure_tmp):
-                bad_repeat = re.search(r"N\d", measure_tmp).group(0)
-                logger.warning(f"Removing unhandled repeat: {bad_repeat}")
-                measure_tmp = re.sub(r"N\d", "", measure_tmp)
+            bad_repeat = _RE_ND.search(measure_tmp)
+            if bad_repeat:
+                logger.warning(f"Removing unhandled repeat: {bad_repeat.group(0)}")
+                measure_tmp = _RE_ND.sub("", measure_tmp)
             new_measures[i] = measure_tmp
 
         return new_measures
@@ -369,29 +467,23 @@ class ChoCoTune(Tune):
             The same string following the preliminary cleaning step.
 
         """
-        # Unify symbol for new measure to |
-        chord_string = re.sub(r'LZ|K', '|', chord_string)
-        # Unify symbol for one-bar repeat to x
-        chord_string = re.sub(r'cl', 'x', chord_string)
-        # Remove stars with empty space in between
-        chord_string = re.sub(r'\*\s*\*', '', chord_string)
-        # Remove vertical spacers
-        chord_string = re.sub(r'Y+', '', chord_string)
-        # Remove empty space
-        chord_string = re.sub(r'XyQ|,', ' ', chord_string)
+        # In a single pass: unify symbols for new measure to | and one-bar
+        # repeat to x, remove stars with empty space in between and vertical
+        # spacers, and replace empty space with whitespace
+        chord_string = _RE_CLEANUP.sub(
+            lambda m: _CLEANUP_REPLACEMENTS[m.lastindex], chord_string)
         # Remove empty measures
-        chord_string = re.sub(r'\|\s*\|', '|', chord_string)
+        chord_string = _RE_EMPTY_MEASURE.sub('|', chord_string)
         # Remove end markers
-        chord_string = re.sub(r'Z', '', chord_string)
+        chord_string = chord_string.replace('Z', '')
 
         # Padding of nested chord annotations: case of ovals
         chord_string = pad_substring(
-            chord_string, r"W(?:/[A-G][#b]?)?", recursive=True)
+            chord_string, _RE_PADDED_OVAL, recursive=True)
 
-        # remove spaces behing bar lines
-        chord_string = re.sub(r'\|\s+', '|', chord_string)       
-        # remove multiple white-spaces
-        chord_string = re.sub(r'\s+', ' ', chord_string)
+        # Remove spaces behind bar lines and multiple white-spaces at once
+        chord_string = _RE_WHITESPACE.sub(
+            lambda m: '|' if m.group(1) else ' ', chord_string)
         # remove trailing white-space
         chord_string = chord_string.rstrip()
 
@@ -410,22 +502,15 @@ class ChoCoTune(Tune):
                 with a single space rather than a blank/nil one.
 
         """
-        # Unify symbol for new measure to |
-        chord_string = re.sub(r'[\[\]]', '|', chord_string)
-        # Remove empty measures: safe because of "n" and "p"
-        chord_string = re.sub(r'\|\s*\|', '|', chord_string)
-        # Remove comments except explicit repeat markers (<3x>)
-        chord_string = re.sub(r'(?!<\d+x>)<.*?>', '', chord_string)
-        # Remove alternative chords, but keep space in-betweens
-        chord_string = re.sub(r'\([^)]*\)', ' ', chord_string)
-        # remove unneeded single l and f (fermata)
-        chord_string = re.sub(r'[lf]', '', chord_string)
-        # Remove s (for 'small), unless it's part of a sus chord
-        chord_string = re.sub(r'(?<!su)s(?!us)', '', chord_string)
-        # Remove section markers
-        chord_string = re.sub(r'\*\w', '', chord_string)
-        # Remove time signatures
-        chord_string = re.sub(r'T\d+', '', chord_string)
+        # Unify symbol for new measure to | and remove the resulting empty
+        # measures at once: safe because of "n" and "p"
+        chord_string = _RE_BRACKET_MEASURE.sub('|', chord_string)
+        # In a single pass: remove comments except explicit repeat markers
+        # (<3x>), unneeded single l and f (fermata), s (for 'small') unless
+        # it's part of a sus chord, section markers, and time signatures;
+        # alternative chords are removed too, but keeping space in-betweens
+        chord_string = _RE_UNSUPPORTED.sub(
+            lambda m: '' if m.group(1) is not None else ' ', chord_string)
 
         return chord_string
 
@@ -455,10 +540,9 @@ class ChoCoTune(Tune):
         chord_string = cls._fill_long_repeats(chord_string)
         chord_string = cls._fill_codas(chord_string)
         # Separating chordal content based on bar markers
-        measures = re.split(r'\||LZ|K|Z|{|}|\[|\]', chord_string)
-        measures = [m.strip() for i, m in enumerate(measures) \
-            if m.strip() != '' or measures[i-1].strip() == "r"]  # XXX n.n.
-        measures = [m.replace("U", "").strip() for m in measures]
+        measures = [m.strip() for m in _RE_MEASURE_SPLIT.split(chord_string)]
+        measures = [m.replace("U", "").strip() for i, m in enumerate(measures) \
+            if m != '' or measures[i-1] == "r"]  # XXX n.n.
         # Infill measure repeat markers (x, r) and within-measure (p)
         measures = cls._fill_single_double_repeats(measures)
         measures = cls._fill_slashes(measures)
@@ -467,7 +551,7 @@ class ChoCoTune(Tune):
         return measures
 
     @staticmethod
-    def parse_ireal_url(url):
+    def parse_ireal_url(url, n_workers=1, backend="loky"):
         """
         Parse iReal charts (URL) into human- and machine-readable formats.
 
@@ -475,6 +559,10 @@ class ChoCoTune(Tune):
         ----------
         url : str
             An url-like string containing one or more tunes.
+        n_workers : int
+            Number of processes that can be used to parse tunes in parallel.
+        backend : str
+            The joblib backend used to parse tunes in parallel.
 
         Returns
         -------
@@ -486,20 +574,148 @@ class ChoCoTune(Tune):
         """
         charts = split_ireal_charts(url)
 
-        tunes, pname = [], None
-        for i, chart in enumerate(charts):
-            if i == len(charts)-1 and "=" not in chart:
-                pname = chart.strip(); break  # fermete
-            try:  # attempt parsing of the individual tune
-                tune = ChoCoTune(chart)
+        pname = None
+        if len(charts) > 0 and "=" not in charts[-1]:
+            pname = charts.pop().strip()  # fermete
+        # Tunes are parsed independently, errors are only logged afterwards
+        parsed = _get_parallel(len(charts), n_workers, backend)\
+            (delayed(_parse_tune)(chart) for chart in charts)
+
+        tunes = []
+        for i, (tune, err) in enumerate(parsed):
+            if err is None:
                 tunes.append(tune)
                 logger.info(f"Parsed tune {i}: {tune.title}")
-            except Exception as err:
+            else:
                 logger.warn(f"Cannot import tune {i}: {err}")
 
         return tunes, pname
 
 
+class _RecordList(logging.Handler):
+    """
+    A logging handler keeping the records it receives, so that records logged
+    in a worker process can be sent back to the parent and handled there.
+    """
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        record.msg, record.args = record.getMessage(), None  # picklable
+        record.exc_info = None
+        self.records.append(record)
+
+
+def _call_logged(func, level, parent_pid, args, kwargs=None):
+    """
+    Call a function in a worker, returning its result together with the
+    records logged by this module at the given level, as worker processes do
+    not share the handlers of the parent; threads of the parent log as usual.
+    If the function raises, the records are attached to the error instead.
+    """
+    kwargs = {} if kwargs is None else kwargs
+    if os.getpid() == parent_pid:
+        return func(*args, **kwargs), []
+
+    records, old_level = _RecordList(), logger.level
+    logger.addHandler(records)
+    logger.setLevel(level)
+    try:
+        return func(*args, **kwargs), records.records
+    except Exception as err:  # the records explaining the failure go with it
+        err.log_records = records.records
+        raise
+    finally:
+        logger.removeHandler(records)
+        logger.setLevel(old_level)
+
+
+def _handle_records(result, records):
+    """
+    Handle the records logged by a worker as if logged here, returning the
+    result of the task that logged them.
+    """
+    for record in records:
+        logging.getLogger(record.name).handle(record)
+    return result
+
+
+def _handle_failed_records(err):
+    """
+    Handle the records logged by a worker before failing with the given error.
+    """
+    _handle_records(None, getattr(err, "log_records", []))
+
+
+def _get_parallel(n_tasks, n_workers, backend="loky", min_tasks=32):
+    """
+    Create a joblib runner for the given number of tasks: small workloads are
+    run sequentially, as starting the workers would dominate the runtime, and
+    larger ones are dispatched to the workers in batches of tasks. Records
+    logged by the workers are handled here, in the order of the tasks.
+    """
+    if n_workers == 1 or n_tasks < min_tasks:
+        return Parallel(n_jobs=1)
+    n_jobs = effective_n_jobs(n_workers)
+    batch_size = max(1, n_tasks // (4 * n_jobs))
+    logger.info(f"Running {n_tasks} tasks on {n_jobs} {backend} workers "
+                f"in batches of {batch_size}")
+    parallel = Parallel(n_jobs=n_jobs, backend=backend, batch_size=batch_size)
+    level, parent_pid = logger.getEffectiveLevel(), os.getpid()
+
+    def run_logged(tasks):
+        try:
+            results = parallel(
+                delayed(_call_logged)(func, level, parent_pid, args, kwargs)
+                for func, args, kwargs in tasks)
+        except Exception as err:
+            _handle_failed_records(err)
+            raise
+        return [_handle_records(*result) for result in results]
+
+    return run_logged
+
+
+def _map_in_order(func, tasks, n_workers, backend="loky"):
+    """
+    Map a function over a list of tasks, yielding the results in the order of
+    the tasks as soon as they are available, so that they can be consumed while
+    the workers process the next tasks; results are not kept once consumed.
+    With a single worker, tasks are run here as their results are consumed.
+    Records logged by the workers are handled here, with their results.
+    """
+    if backend not in ("loky", "threading"):
+        raise ValueError(f"Backend not supported for mapping: {backend}")
+    if n_workers == 1 or len(tasks) < 2:
+        yield from map(func, tasks)
+        return
+    n_jobs = effective_n_jobs(n_workers)
+    logger.info(f"Running {len(tasks)} tasks on {n_jobs} {backend} workers")
+    func = partial(_call_logged, func, logger.getEffectiveLevel(), os.getpid())
+    tasks = [(task,) for task in tasks]  # as the arguments of each call
+    executor_class = ThreadPoolExecutor \
+        if backend == "threading" else LokyProcessPoolExecutor
+    with executor_class(max_workers=n_jobs) as executor:
+        try:
+            for result in executor.map(func, tasks):
+                yield _handle_records(*result)
+        except Exception as err:
+            _handle_failed_records(err)
+            raise
+
+
+def _parse_tune(chart:str):
+    """
+    Attempt parsing of an individual tune, returning either the ChoCoTune or
+    the error raised in the process, as a (tune, error) pair.
+    """
+    try:
+        return ChoCoTune(chart), None
+    except Exception as err:
+        return None, err
+
+
 def extract_metadata_from_tune(tune: ChoCoTune, tune_id=None):
     """
     Extract metadata information from an iReal tune, an object resulting from
@@ -558,11 +774,16 @@ def extract_annotations_from_tune(tune: ChoCoTune):
     beat_duration = measure_beats*len(measures)
 
     chords = []  # iterating and timing chords
+    timings = {}  # onsets and duration of chords, per number of chords
     for m, measure in enumerate(measures, 1):
         measure_chords = measure.split()
-        chord_dur = measure_beats / len(measure_chords)
-        # Creating equal onsets depending on within-measure chords and beats
-        onsets = np.cumsum([0]+[d for d in (len(measure_chords)-1)*[chord_dur]])
+        no_chords = len(measure_chords)
+        if no_chords not in timings:
+            chord_dur = measure_beats / no_chords
+            # Creating equal onsets depending on within-measure chords and beats
+            onsets = np.cumsum([0]+(no_chords-1)*[chord_dur])
+            timings[no_chords] = list(onsets), chord_dur
+        onsets, chord_dur = timings[no_chords]
         chords += [[m, o, chord_dur, c] for o, c in zip(onsets, measure_chords)]
     # Encapsulating key information as a single annotation
     assert len(tune.key.split()) == 1, "Single key assumed for iReal tunes"
@@ -634,7 +855,7 @@ def process_ireal_string(chart_string:str):
     return metadata, jam
 
 
-def process_ireal_charts(chart_data):
+def process_ireal_charts(chart_data, n_workers=1, backend="loky"):
     """
     Read and process iReal chart data or tunes to create a JAMS dataset.
 
@@ -644,6 +865,10 @@ def process_ireal_charts(chart_data):
         Either a list containing instances of ChoCoTune created previously, or
         a string encoding all (raw) charts, or a path to a file containing the
         raw iReal charts.
+    n_workers : int
+        Number of processes that can be used to parse and jamify the tunes.
+    backend : str
+        The joblib backend used to parse and jamify tunes in parallel.
 
     Returns
     -------
@@ -657,8 +882,9 @@ def process_ireal_charts(chart_data):
         if os.path.isfile(chart_data):
             with open(chart_data, 'r') as charts:
                 chart_data = charts.read()
-        if re.match(IREAL_RE, chart_data):
-            tunes, _ = ChoCoTune.parse_ireal_url(chart_data)
+        if _RE_IREAL.match(chart_data):
+            tunes, _ = ChoCoTune.parse_ireal_url(
+                chart_data, n_workers, backend)
     elif isinstance(chart_data, list) and \
         isinstance(chart_data[0], ChoCoTune):
         tunes = chart_data  # ready to go
@@ -666,13 +892,28 @@ def process_ireal_charts(chart_data):
     else:  # none of the supported parameter types/formats
         raise ValueError("Not a valid supported format or broken charts")
     
-    jam_pack = [jamify_ireal_tune(tune) for tune in tunes]
+    jam_pack = _get_parallel(len(tunes), n_workers, backend)\
+        (delayed(jamify_ireal_tune)(tune) for tune in tunes)
     metadata_list, jam_list = list(zip(*jam_pack))
 
     return metadata_list, jam_list
 
 
-def parse_ireal_dataset(dataset_dir, out_dir, dataset_name, **kwargs):
+def _save_jams(jam, jams_path):
+    """
+    Attempt saving a JAMS annotation file to disk, and return whether the file
+    could be saved; errors are logged rather than raised.
+    """
+    try:  # attempt saving the JAMS annotation file to disk
+        jam.save(jams_path, strict=False)
+        return True
+    except Exception as e:  # dumping error, logging for now
+        logging.error(f"Could not save: {jams_path}: {e}")
+        return False
+
+
+def parse_ireal_dataset(dataset_dir, out_dir, dataset_name, n_workers=1,
+    backend="loky", **kwargs):
     """
     Process an iReal dataset to extract metadata information as well as JAMS
     annotations of chords and keys.
@@ -686,6 +927,13 @@ def parse_ireal_dataset(dataset_dir, out_dir, dataset_name, **kwargs):
     dataset_name : str
         Name of the dataset that which will be used for the creation of new ids
         in both the metadata returned the JAMS files produced.
+    n_workers : int
+        Number of processes that can be used to parse chart files in parallel;
+        with more than one, the JAMS files of the chart files already parsed
+        are saved while the workers parse the next ones.
+    backend : str
+        Either 'loky' (processes) or 'threading', to parse chart files in
+        parallel while the JAMS files of those already parsed are saved.
 
     Returns
     -------
@@ -697,11 +945,17 @@ def parse_ireal_dataset(dataset_dir, out_dir, dataset_name, **kwargs):
     all_metadata = []
 
     jams_dir = create_dir(os.path.join(out_dir, "jams"))
-    chart_files = glob.glob(os.path.join(dataset_dir, "*.txt"))
+    with os.scandir(dataset_dir) as entries:  # hidden files are skipped
+        chart_files = [entry.path for entry in entries if entry.is_file()
+            and entry.name.endswith(".txt") and entry.name[0] != "."]
     logger.info(f"Found {len(chart_files)} .txt files for iReal parsing")
 
-    for chart_file in chart_files:
-        for i, (meta, jam) in enumerate(zip(*process_ireal_charts(chart_file))):
+    # Chart files are parsed independently, whereas ids are assigned in order
+    # and JAMS files saved here while the workers parse the next chart files
+    all_charts = _map_in_order(process_ireal_charts, chart_files,
+                               n_workers, backend)
+    for charts in tqdm(all_charts, total=len(chart_files)):
+        for i, (meta, jam) in enumerate(zip(*charts)):
 
             meta["id"] = f"{dataset_name}_{offset_cnt + i}"
             meta["jams_path"] = None  # in case of error
@@ -713,46 +967,28 @@ def parse_ireal_dataset(dataset_dir, out_dir, dataset_name, **kwargs):
                 dataset_name="iReal Pro",
             )
             jams_path = os.path.join(jams_dir, meta["id"]+".jams")
-            try:  # attempt saving the JAMS annotation file to disk
-                jam.save(jams_path, strict=False)
+            if _save_jams(jam, jams_path):
                 meta["jams_path"] = jams_path
-            except Exception as e:  # dumping error, logging for now
-                logging.error(f"Could not save: {jams_path}: {e}")
             all_metadata.append(meta)
         offset_cnt = offset_cnt + i + 1
-    # Finalise the metadata dataframe
-    metadata_df = pd.DataFrame(all_metadata)
-    metadata_df = metadata_df.set_index("id", drop=True)
+    # Finalise the metadata dataframe, built by columns and indexed by id
+    columns = dict.fromkeys(k for meta in all_metadata for k in meta)
+    columns.pop("id")
+    metadata_df = pd.DataFrame(
+        {c: [meta.get(c) for meta in all_metadata] for c in columns},
+        index=pd.Index([meta["id"] for meta in all_metadata], name="id"))
     metadata_df.to_csv(os.path.join(out_dir, "meta.csv"))
 
     return metadata_df
 
 
-def parse_ireal_forum_thread(thread_charts, jams_dir, dataset_name, ireal_db):
+def _select_forum_charts(thread_charts, ireal_db, seen_charts):
     """
-    Process a list of iReal charts that were extracted from a specific thread in
-    the forum, and extract unique chord annotations and content metadata that
-    are not already present in ChoCo.
-
-    Parameters
-    ----------
-    thread_charts : str
-        Path to a CSV file containing a list of charts found in the thread.
-    jams_dir : str
-        Path to the output directory where JAMS annotations will be saved.
-    dataset_name : str
-        Name of the dataset that which will be used for the creation of new ids
-        in both the metadata returned the JAMS files produced.
-    ireal_db : ireal_db.iRealDatabaseHandler
-        Handle to the iReal database, need to register charts and get IDs.
-
-    Returns
-    -------
-    metadata : list of dicts
-        A list tune-specific dictionaries containing extracted metadata.
-
+    Read the charts extracted from a forum thread and return those that are
+    neither in the iReal database nor among the `seen_charts`, which are then
+    updated; charts are only looked up here, and registered once parsed.
     """
-    all_metadata = []
+    new_charts = []
     thread_tunes = pd.read_csv(thread_charts)
 
     thread_name = os.path.splitext(os.path.basename(thread_charts))[0]
@@ -772,35 +1008,149 @@ def parse_ireal_forum_thread(thread_charts, jams_dir, dataset_name, ireal_db):
         logger.info(f"Chart {charts_name} has {len(charts_splitted)} tunes")
 
         for i, chart in enumerate([c for c in charts_splitted if "=" in c]):
-            id_number = ireal_db.register_chart(chart)
-            if id_number is None:  # check repeated entry
+            if chart in seen_charts or ireal_db.search_chart(chart) is not None:
                 logger.warning(f"Chart '{charts_name}/{i}' already in iReal DB")
                 continue  # just ignore and go to next tune
+            seen_charts.add(chart)
+            new_charts.append(chart)
 
-            try:  # read, parse and process the ireal chart if possible
-                meta, jam = process_ireal_string(chart)
-                ireal_db.register_metadata(id_number, meta)
-            except Exception as err:  # dumping error, logging for now
-                logger.error(f"Cannot parse {id_number}: {err}")
-                continue  # just ignore and go to next tune
+    return new_charts
+
+
+def _process_forum_chart(chart:str, jams_path:str):
+    """
+    Parse an iReal chart and save its JAMS file, returning the metadata (None
+    if parsing failed) and the error raised in the process, if any. Workers
+    cannot share the database connection, so registration is left to the caller.
+    """
+    try:  # read, parse and process the ireal chart if possible
+        meta, jam = process_ireal_string(chart)
+    except Exception as err:
+        return None, err
+    try:  # attempt saving the JAMS annotation file to disk
+        jam.save(jams_path, strict=False)
+    except Exception as err:
+        return meta, err
+
+    return meta, None
 
-            meta["id"] = f"{dataset_name}_{id_number}"
-            meta["jams_path"] = None  # null-default path before saving
+
+def _process_forum_thread(chart_jobs):
+    """
+    Parse the charts of a forum thread and save their JAMS files, given as
+    (chart, JAMS path) pairs, returning the (metadata, error) of each chart.
+    """
+    return [_process_forum_chart(chart, jams_path)
+            for chart, jams_path in chart_jobs]
+
+
+def _parse_forum_threads(forum_threads, jams_dir, dataset_name, ireal_db,
+    n_workers=1, backend="loky"):
+    """
+    Parse the new charts of the given forum threads, yielding the metadata of
+    each thread in order, once registered and committed to the iReal database.
+    Workers parse the charts of the next threads and save their JAMS files in
+    temporary paths, as chart IDs are only minted here, when registering them.
+    """
+    seen_charts, thread_jobs = set(), []
+    for t, thread_charts in enumerate(forum_threads):
+        new_charts = _select_forum_charts(thread_charts, ireal_db, seen_charts)
+        thread_jobs.append([(chart, os.path.join(jams_dir, f".{t}_{k}.jams"))
+                            for k, chart in enumerate(new_charts)])
+    logger.info(f"Found {len(seen_charts)} new charts to parse")
+
+    results = _map_in_order(_process_forum_thread, thread_jobs,
+                            n_workers, backend)
+    try:
+        for chart_jobs, thread_results in zip(thread_jobs, results):
+            with ireal_db.transaction():  # each thread is committed as a whole
+                thread_metadata = _register_forum_thread(chart_jobs,
+                    thread_results, jams_dir, dataset_name, ireal_db)
+            yield thread_metadata
+    finally:  # temporary JAMS files are left by charts not saved or registered
+        results.close()  # waiting for the workers still running, if any
+        for chart_jobs in thread_jobs:
+            for _, tmp_path in chart_jobs:
+                if os.path.exists(tmp_path): os.remove(tmp_path)
+
+
+def _register_forum_thread(chart_jobs, thread_results, jams_dir, dataset_name,
+    ireal_db):
+    """
+    Register the charts of a forum thread in the iReal database, given their
+    (chart, temporary JAMS path) pairs and their parsing results, then move
+    their JAMS files to the paths of their IDs, returning their metadata.
+    """
+    all_metadata = []
+    for (chart, tmp_path), (meta, err) in zip(chart_jobs, thread_results):
+        id_number = ireal_db.register_chart(chart)
+        if meta is None:  # dumping error, logging for now
+            logger.error(f"Cannot parse {id_number}: {err}")
+            continue  # just ignore and go to next tune
+
+        ireal_db.register_metadata(id_number, meta)
+        meta["id"] = f"{dataset_name}_{id_number}"
+        meta["jams_path"] = None  # in case of error
+        if err is None:  # the JAMS file was saved by the worker
             jams_path = os.path.join(jams_dir, f"{meta['id']}.jams")
-            try:  # attempt saving the JAMS annotation file to disk
-                jam.save(jams_path, strict=False)
-                meta["jams_path"] = jams_path
-                ireal_db.register_jams(id_number, jams_path)
-            except Exception as err:  # dumping error, logging for now
-                logger.error(f"Could not save {id_number}: {err}")
+            os.replace(tmp_path, jams_path)
+            ireal_db.register_jams(id_number, jams_path)
+            meta["jams_path"] = jams_path
+        else:  # dumping error, logging for now
+            logger.error(f"Could not save {id_number}: {err}")
 
-            all_metadata.append(meta)
+        all_metadata.append(meta)
 
     return all_metadata
 
 
+def parse_ireal_forum_thread(thread_charts, jams_dir, dataset_name, ireal_db):
+    """
+    Process a list of iReal charts that were extracted from a specific thread in
+    the forum, and extract unique chord annotations and content metadata that
+    are not already present in ChoCo.
+
+    Parameters
+    ----------
+    thread_charts : str
+        Path to a CSV file containing a list of charts found in the thread.
+    jams_dir : str
+        Path to the output directory where JAMS annotations will be saved.
+    dataset_name : str
+        Name of the dataset that which will be used for the creation of new ids
+        in both the metadata returned the JAMS files produced.
+    ireal_db : ireal_db.iRealDatabaseHandler
+        Handle to the iReal database, need to register charts and get IDs.
+
+    Returns
+    -------
+    metadata : list of dicts
+        A list tune-specific dictionaries containing extracted metadata.
+
+    """
+    return [meta for thread_metadata in _parse_forum_threads(
+        [thread_charts], jams_dir, dataset_name, ireal_db)
+        for meta in thread_metadata]
+
+
+def _iter_csv_files(root_dir):
+    """
+    Yield the paths of all CSV files under the given directory, in the same
+    order as os.walk, relying on the file types cached by os.scandir.
+    """
+    sub_dirs = []
+    with os.scandir(root_dir) as entries:
+        for entry in entries:
+            if entry.is_dir():  # symlinked directories are not followed
+                if not entry.is_symlink(): sub_dirs.append(entry.path)
+            elif entry.name.endswith(".csv"):
+                yield entry.path
+    for sub_dir in sub_dirs:
+        yield from _iter_csv_files(sub_dir)
+
+
 def parse_ireal_dump(dataset_dir, out_dir, dataset_name, chocodb_path,
-    n_workers=1, **kwargs):
+    n_workers=1, backend="loky", **kwargs):
     """
     Creates a JAMS dataset with content metadata from a dump of the iReal forum.
 
@@ -815,6 +1165,11 @@ def parse_ireal_dump(dataset_dir, out_dir, dataset_name, chocodb_path,
         in both the metadata returned the JAMS files produced.
     chocodb_path : str
         Path to the ChoCo database from which new IDs are minted/retrieved.
+    n_workers : int
+        Number of processes that can be used to parse forum threads in parallel.
+    backend : str
+        Either 'loky' (processes) or 'threading', to parse forum threads in
+        parallel while those already parsed are registered.
 
     Returns
     -------
@@ -825,22 +1180,21 @@ def parse_ireal_dump(dataset_dir, out_dir, dataset_name, chocodb_path,
     iRealDataset = iRealDatabaseHandler(database_path=chocodb_path)
 
     jams_dir = create_dir(os.path.join(out_dir, "jams"))
-    forum_threads = [os.path.join(root, f) for root, _, fnames \
-        in os.walk(dataset_dir) for f in fnames if f.endswith(".csv")]
+    forum_threads = list(_iter_csv_files(dataset_dir))
     logger.info(f"Found {len(forum_threads)} threads in {dataset_dir}")
 
-    with parallel_backend('threading', n_jobs=n_workers):
-        # Spread the computation but keep everything in threads
-        all_metadata = Parallel(n_jobs=n_workers)\
-            (delayed(parse_ireal_forum_thread)\
-                (thread_charts, jams_dir, dataset_name, iRealDataset) \
-                    for thread_charts in tqdm(forum_threads))
+    # New charts are registered here, as only this process holds the database
+    # connection, whereas workers parse the charts of the next forum threads
+    all_metadata = []
+    for thread_metadata in tqdm(_parse_forum_threads(forum_threads, jams_dir,
+        dataset_name, iRealDataset, n_workers, backend),
+        total=len(forum_threads)):
+        all_metadata += thread_metadata
 
     iRealDataset.close()
-    # Finalise the metadata dataframe after merging thread-specific lists
-    all_metadata = list(itertools.chain.from_iterable(all_metadata))
-    metadata_df = pd.DataFrame(all_metadata) 
-    metadata_df = metadata_df.set_index("id", drop=True)
-    metadata_df.to_csv(os.path.join(out_dir, "meta.csv"))
+    # Finalise the metadata dataframe, with charts in order of registration
+    metadata_df = pd.DataFrame.from_records(
+        all_metadata, columns=IREAL_META_COLUMNS, index="id")
+    metadata_df.to_csv(os.path.join(out_dir, "meta.csv"), chunksize=50000)
 
     return metadata_df
@@ -0,0 +1,68 @@
+"""
+Regression tests for the expansion of long repeats in iReal chord strings.
+Expected outputs were produced by the original recursive implementation.
+"""
+import os
+import sys
+
+parsers_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(parsers_path)  # parsers import modules of the package too
+sys.path.append(os.path.dirname(parsers_path))
+
+from ireal_parser import ChoCoTune
+
+
+def test_fill_endings() -> None:
+    """
+    Tests the expansion of repeats with numbered endings.
+    """
+    assert ChoCoTune._fill_long_repeats("{C |D-7 |N1G7 |C }N2G7 |C Z") \
+        == "C |D-7 |G7 |C |C |D-7 |G7 |C Z"
+    assert ChoCoTune._fill_long_repeats("{C |D-7 N1|G7 }N2|F N3|Bb Z") \
+        == "C |D-7 |G7 |C |D-7 |FC |D-7 |Bb Z"
+
+
+def test_fill_shrinking_endings() -> None:
+    """
+    Tests endings that move before the boundary of the repeat as the string
+    shrinks while the previous endings are filled.
+    """
+    assert ChoCoTune._fill_long_repeats("{{<3x>}N1|C C}N2N1") \
+        == " |{ |{||C C| |{ |{| |{ |{|"
+    assert ChoCoTune._fill_long_repeats("{CN3[}C{N3N2S[}{") \
+        == "C[|C|CCS[ |CC[|{"
+
+
+def test_fill_endings_before_repeat() -> None:
+    """
+    Tests endings preceding the repeat being expanded, as well as repeats
+    preceded by blanks only, which are dropped when splicing the expansion.
+    """
+    assert ChoCoTune._fill_long_repeats("N3{|{N2}CQ}[N3") \
+        == "||{|CQ ||{|C|[|{"
+    assert ChoCoTune._fill_long_repeats("  {{} }[Eb^7") \
+        == " |{|  | |{| [Eb^7"
+
+
+def test_fill_nested_repeats() -> None:
+    """
+    Tests repeats that are only exposed once an enclosing one is expanded.
+    """
+    assert ChoCoTune._fill_long_repeats("{{C  }S}}") \
+        == "C   |C  |S |C   |{C  | |C  | |C   |{C  |"
+    assert ChoCoTune._get_measures("{{C }G7 }") \
+        == ["C", "C", "G7", "C", "C", "G7"]
+
+
+def test_get_measures() -> None:
+    """
+    Tests the measures of chord strings with long repeats and endings.
+    """
+    assert ChoCoTune._get_measures(
+        "*A{C^7 |A-7 |D-7 |G7 N1|E-7 A7 }N2|D-7 G7 |C^7 Z") == [
+            "C^7", "A-7", "D-7", "G7", "E-7 A7",
+            "C^7", "A-7", "D-7", "G7", "D-7 G7", "C^7"]
+    assert ChoCoTune._get_measures("*A[C |x |{F |G N1|C |}N2|E- |A- Z") \
+        == ["C", "C", "F", "G", "C", "F", "G", "E-", "A-"]
+    assert ChoCoTune._get_measures("  {{C |D }|G }N1E |F |N2A Z") == [
+        "C", "D", "C", "D", "G", "C", "D", "C", "D", "G", "E", "F", "A"]
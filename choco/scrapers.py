@@ -1,16 +1,19 @@
 """
 """
 import os
-import re
 import csv
 import logging
 import requests
 import argparse
 from time import sleep
 from random import randint
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from urllib.request import urljoin
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession
+from urllib3.util.retry import Retry
+from lxml import etree, html as lxml_html
 import pandas as pd
 
 from utils import create_dir, is_file
@@ -18,85 +21,177 @@ from utils import create_dir, is_file
 DEBUG = True
 MAX_PAGES = 300
 FORUM_BASE_URL = "https://www.irealb.com/forums/"
+# Selectors applied to every page, compiled once: thread titles in forum pages
+# (class is a list of names), links to iReal charts, and 'Next' page buttons
+THREAD_TITLES_XPATH = etree.XPath(
+    '//a[contains(concat(" ", normalize-space(@class), " "), " title ")]')
+IREAL_LINKS_XPATH = etree.XPath('//a[starts-with(@href, "irealb://")]')
+HAS_NEXT_XPATH = etree.XPath('boolean(//img[@alt="Next"])')
+EMPTY_PAGE = "<html><body></body></html>"  # for error and blank pages
+WRITE_BUFFER_SIZE = 1 << 20  # chart CSVs are flushed to disk once per MB
 
 logger = logging.getLogger("choco.scrapers")
 log = print if DEBUG else logger.info
 
+POOL_MAXSIZE = 32  # connections kept alive per host
+HTTP_CACHE_EXPIRY = 86400  # seconds before a cached page is fetched again
+
+
+def create_session(cache_path=None):
+    """
+    Create an HTTP session keeping connections to the forum alive across
+    requests, with retries on failures; if a cache path is given, responses
+    are also cached on disk (SQLite) so that re-runs skip unchanged pages.
+    When retries are exhausted, the last error page is returned as it is.
+    """
+    session = requests.Session() if cache_path is None else CachedSession(
+        cache_path, backend="sqlite", expire_after=HTTP_CACHE_EXPIRY,
+        allowable_methods=("GET",))
+    session.mount("https://", HTTPAdapter(
+        pool_connections=8, pool_maxsize=POOL_MAXSIZE,
+        max_retries=Retry(total=3, backoff_factor=0.3,
+                          status_forcelist=[429, 500, 502, 503, 504],
+                          raise_on_status=False)))
+    return session
+
+
+_SESSION = create_session()  # a single session shared by all requests
+
 
 def request(url, headers=None, timeout=None, min_wait=0, max_wait=0):
 
     max_wait = min_wait + 1 if max_wait <= min_wait else max_wait
-    sleep(randint(min_wait, max_wait))  # wait before request
-    page = requests.get(url, headers=headers, timeout=timeout)
+    page = _SESSION.get(url, headers=headers, timeout=timeout)
+    if not getattr(page, "from_cache", False):  # only wait after real hits
+        sleep(randint(min_wait, max_wait))
 
     return page
 
 
 def write_chart_data(fname, results):
-
+    """
+    Write the charts in `results` to the CSV file `fname`; charts are written
+    to a partial file first, which is renamed only when all have been written,
+    so that an interrupted crawl never leaves a CSV looking complete.
+    """
     header = ["name", 'songs', "ireal_charts"]
-    with open(fname+'.csv', 'w') as chart_file:
+    with open(fname+'.csv.part', 'w', newline='', encoding='utf-8',
+              buffering=WRITE_BUFFER_SIZE) as chart_file:
         write = csv.writer(chart_file)
         write.writerow(header)
         write.writerows(results)
+    os.replace(fname+'.csv.part', fname+'.csv')
 
 
-def process_forum_page(page_url, out_dir, wait=(1,1)):
+def parse_page(page):
     """
-    Find threads in a forum page and process them separately to retrieve
-    iReal charts of playlists and single tracks. Pinned posts are not repeated.
+    Parse the content of a forum page as an lxml HTML tree. Error pages (e.g.
+    still unavailable after retries) and blank ones are parsed as an empty
+    page, hence with no charts and no next page, so that the crawl moves on.
     """
-    history = set()  # forum pages processed so far (to avoid re-visits)
+    if not page.ok or not page.content.strip():
+        logger.warning(f"Skipping empty or error page "
+                       f"({page.status_code}): {page.url}")
+        return lxml_html.document_fromstring(EMPTY_PAGE)
+    return lxml_html.fromstring(page.content)
 
-    for i in range(1, MAX_PAGES):
 
-        full_page_url = page_url + f"/page{i}"
-        log(f"Processing forum page {i}: {full_page_url}")
-        # Retrieve the current forum page to extract all threads found
-        page = request(full_page_url, min_wait=wait[0], max_wait=wait[1])
-        tree = BeautifulSoup(page.content, features="lxml")
-        threads = tree.findAll("a", attrs={"class": "title"})
-
-        for j, thread in enumerate(threads):
-            thread_name = thread.text  # adapted later to be used as file name
-            thread_url = urljoin(FORUM_BASE_URL, thread.get("href"))
-            if thread_url not in history:  # avoid pinned or sticky threads
+def has_next_page(tree):
+    """
+    Whether the parsed forum page links to a next page; the search stops as
+    soon as the first 'Next' button is found.
+    """
+    return HAS_NEXT_XPATH(tree)
+
+
+def process_forum_page(page_url, out_dir, wait=(1,1), n_workers=1,
+                       resume=False):
+    """
+    Find threads in a forum page and process them separately to retrieve
+    iReal charts of playlists and single tracks. Pinned posts are not repeated.
+    Threads are retrieved concurrently by `n_workers` threads, bounded by the
+    size of the connection pool to avoid flooding the forum. When resuming,
+    threads whose CSV file is already in `out_dir` are not retrieved again.
+    Threads with the same title are written to files numbered in order.
+    """
+    history = {}  # thread URLs seen so far -> forum page they were found in
+    file_names = set()  # names of the thread files, kept unique across pages
+    n_workers = max(1, min(n_workers, POOL_MAXSIZE))
+
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        for i in range(1, MAX_PAGES):
+
+            full_page_url = page_url + f"/page{i}"
+            log(f"Processing forum page {i}: {full_page_url}")
+            # Retrieve the current forum page to extract all threads found
+            page = request(full_page_url, min_wait=wait[0], max_wait=wait[1])
+            tree = parse_page(page)
+            threads = [(thread.text_content(), thread.get("href"))
+                       for thread in THREAD_TITLES_XPATH(tree)]
+            next_page = has_next_page(tree)
+            # Free the tree and return the connection before the threads
+            # are retrieved, rather than when the next page is requested
+            page.close()
+            del tree, page
+
+            thread_jobs = []  # retrieval of each thread into its CSV file
+            for j, (thread_name, thread_href) in enumerate(threads):
+                # The thread name is adapted as file name
+                thread_url = urljoin(FORUM_BASE_URL, thread_href)
+                if thread_url in history:  # avoid pinned or sticky threads
+                    continue
+                history[thread_url] = i
+                file_name = base_name = thread_name.replace('/', '-').lower()
+                n_homonyms = 1  # threads with the same title get their own file
+                while file_name in file_names:
+                    n_homonyms += 1
+                    file_name = f"{base_name} ({n_homonyms})"
+                file_names.add(file_name)
+                file_path = os.path.join(out_dir, file_name)
+                if resume and os.path.isfile(file_path + '.csv'):
+                    log(f"Skipping thread {j} already retrieved: {thread_name}")
+                    continue
                 log(f"Retrieving charts for thread {j}: {thread_name}")
-                thread_charts = process_thread_page(thread_url, wait)
-                # Writing everything in a thread-specific CSV file
-                file_name = thread_name.replace('/', '-').lower()  # XXX
-                write_chart_data(os.path.join(out_dir, file_name), thread_charts)
-                history.add(thread_url)  # keep here to avoid inconsistencies
-        
-        if not tree.findAll("img", attrs={"alt": "Next"}): break
+                # Charts are written in a thread-specific CSV file as soon
+                # as each page is retrieved, by the worker consuming them
+                thread_jobs.append(executor.submit(write_chart_data,
+                    file_path, process_thread_page(thread_url, wait)))
+            for thread_job in as_completed(thread_jobs):
+                thread_job.result()  # re-raise retrieval errors, if any
+
+            if not next_page: break
 
 
 def process_thread_page(thread_url, wait=(1,1)):
     """
     Retrieve all ireal-pro charts from a given forum page. Iteratively, inspects
-    all pages in the thread and accumulate results (no checks are performed).
+    all pages in the thread and yields their charts (no checks are performed);
+    pages are only requested as the charts are consumed.
     """
-    page_charts = []
-
     for i in range(1, MAX_PAGES):
         new_url = thread_url + f"/page{i}"
         log(f"Processing thread page {new_url}")
         page = request(new_url, min_wait=wait[0], max_wait=wait[1])
-        tree = BeautifulSoup(page.content, features="lxml")
-        # Update the current page chart and check termination
-        page_charts = page_charts + extract_ireal_charts(tree)
-        if not tree.findAll("img", attrs={"alt": "Next"}): break
-
-    return page_charts
+        tree = parse_page(page)
+        charts, next_page = extract_ireal_charts(tree), has_next_page(tree)
+        # Release the page before its charts are consumed, as the generator
+        # is suspended (holding its locals) while they are being written
+        page.close()
+        del tree, page
+        yield from charts
+        if not next_page: break
 
 
 def extract_ireal_charts(tree):
-
+    """
+    Extract (name, number of charts, iReal URL) tuples from the links found in
+    a parsed page, returning them as a list.
+    """
     ireal_links = []
-    num_charts = lambda url: len(re.findall("===", url))
-    for link in tree.findAll("a", attrs={"href": re.compile("^irealb://")}):
+    for link in IREAL_LINKS_XPATH(tree):
         ireal_chart = link.get("href")  # the actual encoded chord annotation
-        ireal_links.append((link.text, num_charts(ireal_chart), ireal_chart))
+        ireal_links.append(
+            (link.text_content(), ireal_chart.count("==="), ireal_chart))
     
     return ireal_links
 
@@ -126,17 +221,22 @@ def main():
                         help='Whether to resume the crawling process.')    
     parser.add_argument('--num_workers', action='store', type=int, default=0,
                         help='Number of workers for data crawling.')
+    parser.add_argument('--http_cache', action='store',
+                        help='Path to an on-disk cache of the forum pages.')
 
     args = parser.parse_args()
+    if args.http_cache is not None:  # re-runs will reuse cached pages
+        global _SESSION
+        _SESSION = create_session(args.http_cache)
     forum_df = pd.read_csv(args.index)
 
-    for i in range(len(forum_df)):
-        genre_entry = forum_df.loc[i]
+    for genre_entry in forum_df.itertuples(index=False):
         # Make a directory for each genre-specific entry
         forum_dir = create_dir(os.path.join(args.out_dir, genre_entry[0]))
         log(f"EXTRACTING charts from forum page: {genre_entry[0]}")
         process_forum_page(genre_entry[1], forum_dir,
-            wait=(args.min_wait, args.min_wait))
+            wait=(args.min_wait, args.max_wait), n_workers=args.num_workers,
+            resume=args.resume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+"""
+Tests for the scraping of the iReal forum, on responses built locally.
+"""
+import os
+import sys
+
+import requests
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scrapers
+
+THREAD_URL = "https://www.irealb.com/forums/showthread.php?1-thread"
+CHART_PAGE = b'<html><body><a href="irealb://A===B">Tune</a>' \
+             b'<img alt="Next"></body></html>'
+
+
+def make_response(status_code, content, url=THREAD_URL):
+    """
+    Create a response as returned by the session, without any request.
+    """
+    response = requests.Response()
+    response.status_code, response._content, response.url = \
+        status_code, content, url
+    response._content_consumed = True  # no connection to release
+    return response
+
+
+def test_parse_error_page() -> None:
+    """
+    Tests that error and blank pages have no charts and no next page.
+    """
+    for response in [make_response(503, b""), make_response(200, b"  \n"),
+                     make_response(429, b"<html>Too many requests</html>")]:
+        tree = scrapers.parse_page(response)
+        assert scrapers.extract_ireal_charts(tree) == []
+        assert not scrapers.has_next_page(tree)
+
+
+def test_thread_with_error_page(monkeypatch, tmp_path) -> None:
+    """
+    Tests that a thread page still unavailable after retries ends the thread,
+    keeping the charts of the previous pages.
+    """
+    pages = [make_response(200, CHART_PAGE), make_response(503, b"")]
+    monkeypatch.setattr(scrapers, "request", lambda *_, **__: pages.pop(0))
+    monkeypatch.setattr(scrapers, "log", lambda *_: None)
+
+    thread_file = os.path.join(tmp_path, "thread")
+    scrapers.write_chart_data(
+        thread_file, scrapers.process_thread_page(THREAD_URL, wait=(0, 0)))
+    with open(thread_file + ".csv") as chart_file:
+        assert chart_file.read().splitlines() == \
+            ["name,songs,ireal_charts", "Tune,1,irealb://A===B"]
+    assert os.listdir(tmp_path) == ["thread.csv"]
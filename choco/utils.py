@@ -145,7 +145,7 @@ def get_note_index(note_name: str) -> int:
         raise IndexError('The note is not indexed, try with enharmonics.')
 
 
-def pad_substring(string:str, pattern:str, replacement=None, recursive=False):
+def pad_substring(string:str, pattern, replacement=None, recursive=False):
     """
     Safely pad a sub-string, given its regular expression, and return a copy of
     the padded string. By default, only the first occurrence of the string is
@@ -155,8 +155,9 @@ def pad_substring(string:str, pattern:str, replacement=None, recursive=False):
     ----------
     string : str
         The main string that will be searched and replaced for the pattern.
-    pattern : str
-        A regular expression describing the sub-string that will be padded.
+    pattern : str or re.Pattern
+        A regular expression describing the sub-string that will be padded; a
+        pattern that is already compiled is used as is.
     replacement : str
         An optional string to use as a replacement of the sub-string; if not
         provided, the actual sub-string will be kept to be padded.
@@ -164,15 +165,17 @@ def pad_substring(string:str, pattern:str, replacement=None, recursive=False):
         If True, all occurrences of the pattern will be recursively padded.
 
     """
-    match = re.search(pattern, string)
-    if match is None:  # same string is returned if pattern is not found
-        return string
-
-    start, end = match.start(), match.end()
-    s = match.group(0) if replacement is None else replacement
-    l_padding = " " if start != 0 and string[start-1] != " " else ""
-    r_padding = " " if end < len(string) and string[end] != " " else ""
-    new_string = string[:start] + l_padding + s + r_padding
-
-    return new_string + string[end:] if not recursive else \
-        new_string + pad_substring(string[end:], pattern, replacement, True)
+    pattern = re.compile(pattern)  # no-op for compiled patterns
+    padded_chunks, last_end = [], 0
+    match = pattern.search(string)
+    while match is not None:  # same string is returned if pattern is not found
+        start, end = match.start(), match.end()
+        s = match.group(0) if replacement is None else replacement
+        # Left padding is relative to the end of the previous occurrence
+        l_padding = " " if start != last_end and string[start-1] != " " else ""
+        r_padding = " " if end < len(string) and string[end] != " " else ""
+        padded_chunks += [string[last_end:start], l_padding, s, r_padding]
+        last_end = end  # the rest of the string is searched next, if needed
+        match = pattern.search(string, last_end) if recursive else None
+
+    return "".join(padded_chunks) + string[last_end:]